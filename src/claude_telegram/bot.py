@@ -3,16 +3,20 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import html
+import io
 import logging
 import os
 import tempfile
 import time
-from pathlib import Path
-from typing import TYPE_CHECKING
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Awaitable, Callable, Iterable
 
-from telegram import LinkPreviewOptions, Update
+from telegram import LinkPreviewOptions, Message, Update, User
 from telegram.constants import ChatAction, ParseMode
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -21,8 +25,12 @@ from telegram.ext import (
     filters,
 )
 
+from .claude import send_to_tmux, tmux_send_keys
+from .pty_session import WindowsPtySession
+from .ratelimit import RateLimiter
+
 if TYPE_CHECKING:
-    from .claude import ClaudeManager
+    from .claude import ClaudeManager, SessionInfo
     from .config import Settings
     from .store import Store
 
@@ -30,40 +38,276 @@ log = logging.getLogger(__name__)
 
 # Telegram message length limit
 TG_MAX_LEN = 4096
+# Usable text per message — headroom for the truncation marker
+MSG_LIMIT = TG_MAX_LEN - 100
+TRUNC_PREFIX = "... (earlier output)\n\n"
 # Minimum interval between message edits (seconds)
 EDIT_THROTTLE = 2.0
+# Upper bound for the interval after repeated flood control (seconds)
+EDIT_THROTTLE_MAX = 30.0
+# Appends shorter than this wait one more interval before being shown
+EDIT_MIN_DELTA = 80
+# How long a refreshed session snapshot is reused (seconds)
+SESSION_CACHE_TTL = 2.0
 # Disable link previews globally
 NO_PREVIEW = LinkPreviewOptions(is_disabled=True)
+# Documents up to this size are inlined into the prompt; larger ones are
+# saved to a temp file for Claude to read
+MAX_DOC_BYTES = 256 * 1024
+# Bot API getFile limit — larger documents can't be downloaded at all
+MAX_DOC_DOWNLOAD_BYTES = 20 * 1024 * 1024
+# Largest photo size downloaded for Claude to read
+MAX_PHOTO_BYTES = 5 * 1024 * 1024
+# Text updates from one user arriving within this window form one prompt (seconds)
+COALESCE_WINDOW = 0.6
+# Longer wait after a near-limit part — Telegram splits long pastes at 4096 chars
+COALESCE_WINDOW_LONG = 2.0
+SPLIT_PART_LEN = 4000
+# Per-user state kept for at most this many users (least recently used dropped)
+MAX_TRACKED_USERS = 10_000
+# Updates forwarded to Claude: plain text (not commands), documents, photos
+MESSAGE_FILTER = filters.TEXT & ~filters.COMMAND | filters.Document.ALL | filters.PHOTO
+
+# /help reply (HTML)
+HELP_TEXT = (
+    "<b>명령어</b>\n\n"
+    "<b>프로젝트</b>\n"
+    "  /projects  전체 목록\n"
+    "  /1 /2 …  번호로 전환\n"
+    "  /project &lt;이름&gt;  이름으로 전환\n\n"
+    "<b>대화</b>\n"
+    "  /new  새 대화 시작\n"
+    "  /stop  작업 중단\n"
+    "  /esc  Escape 전송\n"
+    "  /yes  권한 승인\n\n"
+    "<b>상태</b>\n"
+    "  /status  세션 상태 확인\n\n"
+    "<i>메시지를 보내면 현재 프로젝트의 Claude에 전달됩니다</i>"
+)
+# Shared command replies (HTML)
+NO_ACTIVE_PROJECT = "⚠️ 활성 프로젝트가 없습니다"
+NO_SESSION = "⚠️ 세션이 없습니다"
+STOPPED = "⏹ <b>작업 중단</b>"
+# /start reply (HTML) — fields are escaped by the caller
+START_TEMPLATE = (
+    "<b>Claude Code Telegram</b>\n\n"
+    "  📂  현재 프로젝트  <b>{current}</b>\n"
+    "  📡  활성 세션  <code>{sessions}</code>\n\n"
+    "  /help 로 명령어 확인"
+)
 
 
-def _truncate(text: str, limit: int = TG_MAX_LEN - 100) -> str:
+def _truncate_tail(text: str, limit: int = MSG_LIMIT) -> str:
+    """Keep the last `limit` chars so a long stream still shows new output.
+
+    Starts at a line break when one falls in the first half of the window.
+    """
     if len(text) <= limit:
         return text
-    return text[:limit] + "\n\n... (truncated)"
+    start = len(text) - limit
+    nl = text.find("\n", start, start + limit // 2)
+    if nl != -1:
+        start = nl + 1
+    return TRUNC_PREFIX + text[start:]
 
 
 def _escape(text: str) -> str:
-    return html.escape(text)
+    # Only element text is escaped (never attribute values) — skip the quote passes
+    return html.escape(text, quote=False)
 
 
-def _split_message(text: str, limit: int = TG_MAX_LEN - 100) -> list[str]:
-    """Split long text into multiple messages."""
-    if len(text) <= limit:
+@functools.lru_cache(maxsize=512)
+def _basename(path: str) -> str:
+    """Last path component for display — session paths rarely change, so memoize."""
+    return os.path.basename(path.rstrip("/"))
+
+
+@functools.lru_cache(maxsize=512)
+def _basename_lower(path: str) -> str:
+    """Lower-cased _basename, for case-insensitive matching."""
+    return _basename(path).lower()
+
+
+def _not_modified(e: BadRequest) -> bool:
+    """Telegram rejects edits that would leave the message text identical."""
+    return "not modified" in str(e).lower()
+
+
+def _decode_capped(data: bytes, limit: int = MAX_DOC_BYTES) -> str:
+    """Decode at most `limit` bytes of an attached text file."""
+    text = data[:limit].decode("utf-8", errors="replace")
+    if len(data) > limit:
+        text += f"\n... (truncated at {limit} bytes)"
+    return text
+
+
+def _remove_files(paths: Iterable[str]) -> None:
+    """Delete temp files, ignoring ones already gone (blocking — run in a thread)."""
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _split_message(text: str, limit: int = MSG_LIMIT) -> list[str]:
+    """Split long text into multiple messages.
+
+    Walks the string by index — each part is sliced once, the remaining
+    tail is never copied (rfind is a C-level reverse memchr).
+    """
+    n = len(text)
+    if n <= limit:
         return [text]
     parts: list[str] = []
-    while text:
-        if len(text) <= limit:
-            parts.append(text)
+    pos = 0
+    while pos < n:
+        end = pos + limit
+        if end >= n:
+            parts.append(text[pos:])
             break
         # Find a good split point
-        split_at = text.rfind("\n", 0, limit)
-        if split_at < limit // 2:
-            split_at = limit
-        parts.append(text[:split_at])
-        text = text[split_at:].lstrip("\n")
+        split_at = text.rfind("\n", pos, end)
+        if split_at < pos + limit // 2:
+            split_at = end
+        parts.append(text[pos:split_at])
+        # Skip newlines at the cut instead of lstrip-copying the tail
+        pos = split_at
+        while pos < n and text[pos] == "\n":
+            pos += 1
     return parts
 
 
+_Handler = Callable[["Bot", Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]
+
+
+def _allowed_only(handler: _Handler) -> _Handler:
+    """Drop updates without a user or from users outside CT_ALLOWED_USERS."""
+    @functools.wraps(handler)
+    async def wrapper(self: Bot, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        if not user or not self._is_allowed(user.id):
+            return
+        await handler(self, update, ctx)
+    return wrapper
+
+
+@dataclass
+class _UserState:
+    """Everything the bot tracks per Telegram user."""
+    project: str | None = None  # active project_dir (None = default session)
+    base: str = ""  # _basename(project), computed once when switching
+    pending: list[Message] = field(default_factory=list)  # text updates being coalesced
+
+    def switch(self, project: str) -> None:
+        self.project = project
+        self.base = _basename(project)
+
+
+class _EditPacer:
+    """Bot-wide streaming edit interval.
+
+    Doubles on flood control (up to EDIT_THROTTLE_MAX) and decays back
+    towards EDIT_THROTTLE with each successful edit.
+    """
+
+    def __init__(self) -> None:
+        self.interval = EDIT_THROTTLE
+
+    def backoff(self) -> None:
+        self.interval = min(self.interval * 2, EDIT_THROTTLE_MAX)
+
+    def relax(self) -> None:
+        self.interval = max(EDIT_THROTTLE, self.interval * 0.95)
+
+
+class _StreamEditor:
+    """Single writer that mirrors streamed text into one Telegram message.
+
+    The stream callback only stores the latest full text; the writer task
+    wakes on new text and edits at most once per pacer interval, so the
+    Claude poll loop never waits on a Telegram round-trip.
+    """
+
+    def __init__(self, reply: Message, limiter: RateLimiter, pacer: _EditPacer) -> None:
+        self._reply = reply
+        self._limiter = limiter
+        self._pacer = pacer
+        self._dirty = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._shown = ""
+        self._sent = ""  # last display text Telegram has (post-truncation)
+        self._deferred = False
+        self.text = ""
+
+    @property
+    def sent(self) -> str:
+        """Text the streamed message currently shows on Telegram."""
+        return self._sent
+
+    def update(self, full_text: str) -> None:
+        self.text = full_text
+        self._dirty.set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()  # no-op if it already finished
+        try:
+            await task  # also retrieves an exception the writer died with
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            log.debug("Stream writer failed", exc_info=True)
+
+    def _small_append(self, text: str) -> bool:
+        shown = self._shown
+        return bool(shown) and text.startswith(shown) and len(text) - len(shown) < EDIT_MIN_DELTA
+
+    async def _run(self) -> None:
+        while True:
+            await self._dirty.wait()
+            text = self.text
+            # A tiny append waits one interval to grow — but only once,
+            # so short output (e.g. a permission prompt) still shows up
+            if not self._deferred and self._small_append(text):
+                self._deferred = True
+                await asyncio.sleep(self._pacer.interval)
+                continue
+            self._deferred = False
+            self._dirty.clear()
+            # isspace() scans without copying (stream_cb never passes "")
+            display = "" if text.isspace() else _truncate_tail(text)
+            if display and display == self._sent:
+                # Same as the last edit — skip the round-trip
+                self._shown = text
+                continue
+            if display:
+                try:
+                    await self._limiter.send(self._reply.chat_id, functools.partial(
+                        self._reply.edit_text, display, link_preview_options=NO_PREVIEW))
+                    self._shown, self._sent = text, display
+                    self._pacer.relax()
+                except BadRequest as e:
+                    if _not_modified(e):
+                        self._shown, self._sent = text, display
+                    else:
+                        log.debug("Stream edit rejected: %s", e)
+                except RetryAfter:
+                    # Limiter already paused every sender for the window
+                    self._pacer.backoff()
+                except NetworkError as e:
+                    log.debug("Stream edit failed: %s", e)
+                except TelegramError as e:
+                    # e.g. Forbidden — keep the writer alive, the final send reports it
+                    log.debug("Stream edit error: %s", e)
+            await asyncio.sleep(self._pacer.interval)
+
+
 class Bot:
     def __init__(
         self,
@@ -74,222 +318,318 @@ class Bot:
         self.settings = settings
         self.claude = claude
         self.store = store
-        # user_id -> active project_dir
-        self._user_projects: dict[int, str] = {}
+        # user_id -> active project + pending text batch, in LRU order
+        self._users: OrderedDict[int, _UserState] = OrderedDict()
+        # project -> execution lock; keyed by project, not user, because two
+        # users on the same project would otherwise type into one pane
+        self._project_locks: dict[str, asyncio.Lock] = {}
+        # Parsed once — checked on every update
+        self._allowed: frozenset[int] = frozenset()
+        # Same list applied at dispatch — other users' updates never start a handler
+        self._user_filter = filters.User(allow_empty=True)
+        self.refresh_acl()
+        # CT_PROJECT_DIRS parsed once as (dir, display name) — listed by /projects and /N
+        self._project_dirs: tuple[tuple[str, str], ...] = tuple(
+            (d, _basename(d)) for d in settings.get_project_dirs())
+        # Full path or lower-cased basename -> (dir, display name), first one wins
+        self._project_by_key: dict[str, tuple[str, str]] = {}
+        for entry in self._project_dirs:
+            self._project_by_key.setdefault(entry[0], entry)
+            self._project_by_key.setdefault(entry[1].lower(), entry)
+        # Shared by every outgoing send/edit
+        self._limiter = RateLimiter()
+        self._edit_pacer = _EditPacer()
+        # (refreshed_at, sessions) — see _sessions()
+        self._sessions_cache: tuple[float, dict[str, SessionInfo]] | None = None
+        # Last registry reload (claude.refresh()) — see _sessions(reload=True)
+        self._reloaded_at = float("-inf")
+        # lower-cased name / work_dir basename -> (name, info), rebuilt with the cache
+        self._session_index: dict[str, tuple[str, SessionInfo]] = {}
+        # (lower-cased name, name, info) in session order — partial-match scans
+        self._session_names: tuple[tuple[str, str, SessionInfo], ...] = ()
+        # work_dir or name -> session name, for showing the current project
+        self._session_by_dir: dict[str, str] = {}
+        # work_dirs of tmux (non-SDK) sessions — hides duplicates in /projects
+        self._tmux_dirs: frozenset[str] = frozenset()
+        # First session's directory — default for users who never switched
+        self._default_project: str | None = None
+        self._default_base: str | None = None
+        # Numbered /projects entries (num, name, work_dir, is_tmux) for this snapshot
+        self._project_list: tuple[tuple[int, str, str, bool], ...] = ()
+        # num -> same entry, for /N
+        self._project_by_num: dict[int, tuple[int, str, str, bool]] = {}
+
+    def refresh_acl(self) -> None:
+        """Re-read CT_ALLOWED_USERS (empty = everyone allowed)."""
+        self._allowed = frozenset(self.settings.get_allowed_users())
+        self._user_filter.user_ids = self._allowed
 
     def _is_allowed(self, user_id: int) -> bool:
-        allowed = self.settings.get_allowed_users()
-        return not allowed or user_id in allowed
+        return not self._allowed or user_id in self._allowed
+
+    def _sessions(self, reload: bool = False) -> dict[str, SessionInfo]:
+        """Session snapshot with its lookups, re-read at most every SESSION_CACHE_TTL.
+
+        Only the listing commands pass reload=True. refresh() re-reads every
+        session file, probes each tmux pane and rebuilds the session objects
+        (dropping connected PTY sessions and SDK sessions), so message and
+        key-sending paths just read ClaudeManager's current sessions.
+        """
+        now = time.monotonic()
+        cached = self._sessions_cache
+        if reload and now - self._reloaded_at >= SESSION_CACHE_TTL:
+            self.claude.refresh()
+            self._reloaded_at = now
+            cached = None
+        if cached is None or now - cached[0] >= SESSION_CACHE_TTL:
+            cached = self._sessions_cache = (now, self.claude.get_all_sessions())
+            self._reindex(cached[1])
+        return cached[1]
+
+    def _reindex(self, sessions: dict[str, SessionInfo]) -> None:
+        """Rebuild the lookups derived from a fresh session snapshot.
+
+        Earlier sessions win on collisions, same as the old in-order scans.
+        """
+        index: dict[str, tuple[str, SessionInfo]] = {}
+        by_dir: dict[str, str] = {}
+        tmux_dirs: set[str] = set()
+        for name, info in sessions.items():
+            index.setdefault(name.lower(), (name, info))
+            base = _basename_lower(info.work_dir)
+            if base:
+                index.setdefault(base, (name, info))
+            by_dir.setdefault(info.work_dir, name)
+            by_dir.setdefault(name, name)
+            if not name.startswith("sdk:"):
+                tmux_dirs.add(info.work_dir)
+        self._session_index = index
+        self._session_names = tuple((n.lower(), n, i) for n, i in sessions.items())
+        self._session_by_dir = by_dir
+        self._tmux_dirs = frozenset(tmux_dirs)
+        first = next(iter(sessions.values()), None)
+        self._default_project = (first.work_dir or first.project) if first else None
+        self._default_base = _basename(self._default_project) if self._default_project else None
+        self._project_list = self._number_projects(sessions)
+        self._project_by_num = {entry[0]: entry for entry in self._project_list}
+
+    def _user(self, user_id: int) -> _UserState:
+        users = self._users
+        state = users.get(user_id)
+        if state is None:
+            state = users[user_id] = _UserState()
+            if len(users) > MAX_TRACKED_USERS:
+                self._evict_idle_user()
+        else:
+            users.move_to_end(user_id)
+        return state
+
+    def _project_lock(self, project: str) -> asyncio.Lock:
+        lock = self._project_locks.get(project)
+        if lock is None:
+            lock = self._project_locks[project] = asyncio.Lock()
+        return lock
+
+    def _evict_idle_user(self) -> None:
+        """Drop the least recently used user with no text batch being coalesced.
+
+        A user mid-burst is never evicted — the rest of the burst would
+        start a second prompt.
+        """
+        idle = next((uid for uid, st in self._users.items() if not st.pending), None)
+        if idle is not None:
+            del self._users[idle]
 
     def _get_project(self, user_id: int) -> str | None:
-        if user_id in self._user_projects:
-            return self._user_projects[user_id]
-        # Default to first available tmux session
-        sessions = self.claude.get_all_sessions()
-        if sessions:
-            first = next(iter(sessions.values()))
-            self._user_projects[user_id] = first.work_dir or first.project
-            return self._user_projects[user_id]
-        return None
+        state = self._users.get(user_id)
+        if state is not None and state.project is not None:
+            return state.project
+        # Default to first available tmux session — read from the current
+        # sessions (no registry reload), memoized with the snapshot
+        self._sessions()
+        return self._default_project
+
+    def _get_project_base(self, user_id: int) -> str | None:
+        """Display name (basename) of the user's active project."""
+        state = self._users.get(user_id)
+        if state is not None and state.project is not None:
+            return state.base
+        self._sessions()
+        return self._default_base
 
     # --- Command Handlers ---
 
     async def _reply_html(self, update: Update, text: str) -> None:
         """Send HTML-formatted reply."""
-        await update.message.reply_text(  # type: ignore[union-attr]
-            text, parse_mode=ParseMode.HTML, link_preview_options=NO_PREVIEW,
-        )
+        msg: Message = update.message  # type: ignore[assignment]
+        await self._limiter.send(msg.chat_id, functools.partial(
+            msg.reply_text, text, parse_mode=ParseMode.HTML, link_preview_options=NO_PREVIEW,
+        ))
 
+    @_allowed_only
     async def cmd_start(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
-        user = update.effective_user
-        if not user or not self._is_allowed(user.id):
-            return
-        sessions = self.claude.get_all_sessions()
-        current = self._get_project(user.id)
-        current_name = _escape(os.path.basename(current)) if current else "—"
+        user: User = update.effective_user  # type: ignore[assignment]
+        sessions = self._sessions()
+        current = self._get_project_base(user.id)
+        current_name = _escape(current) if current else "—"
         session_names = [_escape(n) for n in sessions.keys()]
         session_str = ", ".join(session_names) if session_names else "없음"
-        await self._reply_html(update,
-            f"<b>Claude Code Telegram</b>\n\n"
-            f"  📂  현재 프로젝트  <b>{current_name}</b>\n"
-            f"  📡  활성 세션  <code>{session_str}</code>\n\n"
-            f"  /help 로 명령어 확인",
-        )
+        await self._reply_html(update, START_TEMPLATE.format(
+            current=current_name, sessions=session_str))
 
+    @_allowed_only
     async def cmd_help(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
-        if not update.effective_user or not self._is_allowed(update.effective_user.id):
-            return
-        await self._reply_html(update,
-            "<b>명령어</b>\n\n"
-            "<b>프로젝트</b>\n"
-            "  /projects  전체 목록\n"
-            "  /1 /2 …  번호로 전환\n"
-            "  /project &lt;이름&gt;  이름으로 전환\n\n"
-            "<b>대화</b>\n"
-            "  /new  새 대화 시작\n"
-            "  /stop  작업 중단\n"
-            "  /esc  Escape 전송\n"
-            "  /yes  권한 승인\n\n"
-            "<b>상태</b>\n"
-            "  /status  세션 상태 확인\n\n"
-            "<i>메시지를 보내면 현재 프로젝트의 Claude에 전달됩니다</i>",
-        )
+        await self._reply_html(update, HELP_TEXT)
 
+    @_allowed_only
     async def cmd_stop(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
         """Ctrl+C 전송."""
-        user = update.effective_user
-        if not user or not self._is_allowed(user.id):
-            return
+        user: User = update.effective_user  # type: ignore[assignment]
         project = self._get_project(user.id)
         if not project:
-            await self._reply_html(update, "⚠️ 활성 프로젝트가 없습니다")
+            await self._reply_html(update, NO_ACTIVE_PROJECT)
             return
         session = self.claude.get_session(user.id, project)
         if session:
             try:
-                from .pty_session import WindowsPtySession
                 if isinstance(session, WindowsPtySession):
                     await session.send_key("\x03")
                 else:
-                    import subprocess
-                    subprocess.run(["tmux", "send-keys", "-t", session.info.pane_id, "C-c"], timeout=5)
-                await self._reply_html(update, "⏹ <b>작업 중단</b>")
+                    await tmux_send_keys(session.info.pane_id, "C-c")
+                await self._reply_html(update, STOPPED)
                 return
             except Exception:
                 pass
         interrupted = await self.claude.interrupt_session(user.id, project)
         if interrupted:
-            await self._reply_html(update, "⏹ <b>작업 중단</b>")
+            await self._reply_html(update, STOPPED)
         else:
             await self._reply_html(update, "⚠️ 실행 중인 작업이 없습니다")
 
+    @_allowed_only
     async def cmd_esc(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
         """Escape 키 전송."""
-        user = update.effective_user
-        if not user or not self._is_allowed(user.id):
-            return
+        user: User = update.effective_user  # type: ignore[assignment]
         project = self._get_project(user.id)
         if not project:
-            await self._reply_html(update, "⚠️ 활성 프로젝트가 없습니다")
+            await self._reply_html(update, NO_ACTIVE_PROJECT)
             return
         session = self.claude.get_session(user.id, project)
         if session:
-            from .pty_session import WindowsPtySession
             if isinstance(session, WindowsPtySession):
                 await session.send_key("\x1b")
             else:
-                import subprocess
-                subprocess.run(["tmux", "send-keys", "-t", session.info.pane_id, "Escape"], timeout=5)
+                await tmux_send_keys(session.info.pane_id, "Escape")
             await self._reply_html(update, "⎋ <b>Escape 전송</b>")
         else:
-            await self._reply_html(update, "⚠️ 세션이 없습니다")
+            await self._reply_html(update, NO_SESSION)
 
+    @_allowed_only
     async def cmd_yes(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
         """권한 승인 — y + Enter 전송."""
-        user = update.effective_user
-        if not user or not self._is_allowed(user.id):
-            return
+        user: User = update.effective_user  # type: ignore[assignment]
         project = self._get_project(user.id)
         if not project:
-            await self._reply_html(update, "⚠️ 활성 프로젝트가 없습니다")
+            await self._reply_html(update, NO_ACTIVE_PROJECT)
             return
         session = self.claude.get_session(user.id, project)
         if session:
-            from .pty_session import WindowsPtySession
             if isinstance(session, WindowsPtySession):
                 await session.send_key("y\n")
             else:
-                import subprocess
-                subprocess.run(["tmux", "send-keys", "-t", session.info.pane_id, "y"], timeout=5)
+                await tmux_send_keys(session.info.pane_id, "y")
                 await asyncio.sleep(0.1)
-                subprocess.run(["tmux", "send-keys", "-t", session.info.pane_id, "Enter"], timeout=5)
+                await tmux_send_keys(session.info.pane_id, "Enter")
             await self._reply_html(update, "✅ <b>승인 전송</b>")
         else:
-            await self._reply_html(update, "⚠️ 세션이 없습니다")
+            await self._reply_html(update, NO_SESSION)
 
+    @_allowed_only
     async def cmd_new(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
-        user = update.effective_user
-        if not user or not self._is_allowed(user.id):
-            return
+        user: User = update.effective_user  # type: ignore[assignment]
         project = self._get_project(user.id)
         if not project:
-            await self._reply_html(update, "⚠️ 활성 프로젝트가 없습니다")
+            await self._reply_html(update, NO_ACTIVE_PROJECT)
             return
 
         session = self.claude.get_session(user.id, project)
         if session:
             try:
-                from .pty_session import WindowsPtySession
                 if isinstance(session, WindowsPtySession):
                     await session.send_key("/new\n")
                 else:
-                    from .claude import send_to_tmux
                     await send_to_tmux(session.info.pane_id, "/new")
                 await self._reply_html(update, "🔄 <b>새 대화 시작</b>")
             except Exception:
                 log.warning("Failed to send /new", exc_info=True)
                 await self._reply_html(update, "❌ /new 전송 실패")
         else:
-            await self._reply_html(update, "⚠️ 세션이 없습니다")
+            await self._reply_html(update, NO_SESSION)
 
+    @_allowed_only
     async def cmd_project(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
-        user = update.effective_user
-        if not user or not self._is_allowed(user.id):
-            return
-        args = (update.message.text or "").split(maxsplit=1)  # type: ignore[union-attr]
-        if len(args) < 2:
+        user: User = update.effective_user  # type: ignore[assignment]
+        # CommandHandler already tokenized the text after the command
+        target = " ".join(ctx.args or ())
+        if not target:
             current = self._get_project(user.id)
             current_name = "—"
             if current:
-                for name, info in self.claude.get_all_sessions().items():
-                    if info.work_dir == current or name == current:
-                        current_name = name
-                        break
-                else:
-                    current_name = os.path.basename(current)
+                self._sessions()
+                current_name = self._session_by_dir.get(current) or _basename(current)
             await self._reply_html(update,
                 f"📂 현재  <b>{_escape(current_name)}</b>\n\n"
                 f"<i>/project &lt;이름&gt; 으로 전환</i>")
             return
-        target = args[1].strip()
-        self.claude.refresh()
-        sessions = self.claude.get_all_sessions()
-        for name, info in sessions.items():
-            if target.lower() in (name.lower(), os.path.basename(info.work_dir).lower()):
-                self._user_projects[user.id] = info.work_dir or name
-                await self._reply_html(update, f"📂 <b>{_escape(name)}</b> 으로 전환")
-                return
-        for name, info in sessions.items():
-            if target.lower() in name.lower():
-                self._user_projects[user.id] = info.work_dir or name
-                await self._reply_html(update, f"📂 <b>{_escape(name)}</b> 으로 전환")
-                return
+        sessions = self._sessions(reload=True)
+        key = target.lower()
+        # Exact name / directory match, then partial name match
+        hit = self._session_index.get(key)
+        if hit is None:
+            hit = next(((n, i) for lname, n, i in self._session_names if key in lname), None)
+        if hit is not None:
+            name, info = hit
+            self._user(user.id).switch(info.work_dir or name)
+            await self._reply_html(update, f"📂 <b>{_escape(name)}</b> 으로 전환")
+            return
+        # Configured in CT_PROJECT_DIRS but no session running
+        entry = self._project_by_key.get(target) or self._project_by_key.get(key)
+        if entry is not None:
+            d, base = entry
+            await self._reply_html(update, self._switch_project(user.id, base, d, False))
+            return
         names = [_escape(n) for n in sessions.keys()]
         await self._reply_html(update,
             f"⚠️ <code>{_escape(target)}</code> 을(를) 찾을 수 없습니다\n\n"
             f"활성 세션: {', '.join(names) or '없음'}")
 
-    def _build_project_list(self) -> list[tuple[int, str, str, bool]]:
-        """Build numbered project list: (num, name, work_dir, is_tmux).
+    def _build_project_list(self) -> tuple[tuple[int, str, str, bool], ...]:
+        """Numbered project list: (num, name, work_dir, is_tmux).
 
-        Active tmux sessions first, then inactive env projects.
+        Rebuilt only when the session snapshot is, so /projects and /N
+        bursts within SESSION_CACHE_TTL share one list.
         """
+        self._sessions(reload=True)
+        return self._project_list
+
+    def _number_projects(
+        self, sessions: dict[str, SessionInfo],
+    ) -> tuple[tuple[int, str, str, bool], ...]:
+        """Active tmux sessions first, then inactive env projects."""
         result: list[tuple[int, str, str, bool]] = []
-        tmux_sessions = self.claude.get_all_sessions()
-        tmux_dirs: set[str] = set()
+        tmux_dirs = self._tmux_dirs
         num = 1
-        for name, info in tmux_sessions.items():
+        for name, info in sessions.items():
             if name.startswith("sdk:"):
                 continue
             result.append((num, name, info.work_dir, True))
-            tmux_dirs.add(info.work_dir)
             num += 1
         # Inactive projects from env (no tmux session)
-        for d in self.settings.get_project_dirs():
+        for d, base in self._project_dirs:
             if d not in tmux_dirs:
-                result.append((num, os.path.basename(d), d, False))
+                result.append((num, base, d, False))
                 num += 1
-        return result
+        return tuple(result)
 
     def _switch_project(self, user_id: int, name: str, work_dir: str, is_tmux: bool) -> str:
         """Switch user's active project. Returns HTML message.
@@ -299,16 +639,13 @@ class Bot:
         if not is_tmux:
             return (f"⚠️ <b>{_escape(name)}</b> — 비활성 세션\n\n"
                     f"<i>tmux에서 Claude Code를 먼저 실행하세요</i>")
-        self._user_projects[user_id] = work_dir or name
+        self._user(user_id).switch(work_dir or name)
         return f"📂 <b>{_escape(name)}</b> 으로 전환"
 
+    @_allowed_only
     async def cmd_projects(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
-        user = update.effective_user
-        if not user or not self._is_allowed(user.id):
-            return
-        self.claude.refresh()
-        current = self._get_project(user.id)
-        current_base = os.path.basename(current.rstrip("/")) if current else ""
+        user: User = update.effective_user  # type: ignore[assignment]
+        current_base = self._get_project_base(user.id) or ""
         projects = self._build_project_list()
         if not projects:
             await self._reply_html(update, "⚠️ 등록된 프로젝트가 없습니다")
@@ -321,37 +658,33 @@ class Bot:
         lines.append(f"\n<i>● 활성  ◦ 비활성  ◀ 현재</i>")
         await self._reply_html(update, "\n".join(lines))
 
+    @_allowed_only
     async def cmd_switch_by_number(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /1, /2, ... commands to switch project by number."""
-        user = update.effective_user
-        if not user or not self._is_allowed(user.id):
-            return
+        user: User = update.effective_user  # type: ignore[assignment]
         text = (update.message.text or "").strip()  # type: ignore[union-attr]
         try:
             num = int(text.lstrip("/"))
         except ValueError:
             return
-        self.claude.refresh()
-        projects = self._build_project_list()
-        for pnum, name, work_dir, is_tmux in projects:
-            if pnum == num:
-                msg = self._switch_project(user.id, name, work_dir, is_tmux)
-                await self._reply_html(update, msg)
-                return
-        await self._reply_html(update, f"⚠️ /{num} — 없는 번호입니다\n/projects 로 확인하세요")
+        self._sessions(reload=True)
+        entry = self._project_by_num.get(num)
+        if entry is None:
+            await self._reply_html(update, f"⚠️ /{num} — 없는 번호입니다\n/projects 로 확인하세요")
+            return
+        _, name, work_dir, is_tmux = entry
+        await self._reply_html(update, self._switch_project(user.id, name, work_dir, is_tmux))
 
+    @_allowed_only
     async def cmd_status(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
-        user = update.effective_user
-        if not user or not self._is_allowed(user.id):
-            return
-        self.claude.refresh()
-        sessions = self.claude.get_all_sessions()
+        user: User = update.effective_user  # type: ignore[assignment]
+        sessions = self._sessions(reload=True)
         running = self.claude.get_active_projects(user.id)
-        current = self._get_project(user.id)
+        current_base = self._get_project_base(user.id)
 
         lines = [f"<b>세션 상태</b>  —  {len(sessions)}개\n"]
         for name, info in sessions.items():
-            is_current = current and (name == os.path.basename(current.rstrip("/")))
+            is_current = name == current_base
             is_running = info.project in running
             cur = "  ◀" if is_current else ""
             dot = "▶" if is_running else "●"
@@ -364,104 +697,176 @@ class Bot:
 
     # --- Message Handler ---
 
+    @_allowed_only
     async def handle_message(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
-        user = update.effective_user
+        user: User = update.effective_user  # type: ignore[assignment]
         msg = update.message
-        if not user or not msg or not self._is_allowed(user.id):
+        if not msg:
             return
 
         project = self._get_project(user.id)
         if not project:
-            await msg.reply_text(
+            await self._limiter.send(msg.chat_id, functools.partial(
+                msg.reply_text,
                 "⚠️ 프로젝트 미설정\n\n<i>.env에 CT_PROJECT_DIRS를 설정하세요</i>",
-                parse_mode=ParseMode.HTML)
+                parse_mode=ParseMode.HTML))
             return
 
         log.info("Message from %s → project %s", user.id, project)
 
-        # Build prompt from text + files
-        prompt = await self._build_prompt(msg, ctx)
-        if not prompt:
-            return
+        # Build prompt. Attachments download under a typing indicator; plain
+        # text waits briefly so a paste Telegram split into parts is one prompt
+        temp_files: list[str] = []
+        try:
+            if msg.document or msg.photo:
+                # A failed typing action must not abandon a download still adding temp files
+                prompt, _ = await asyncio.gather(
+                    self._build_prompt(msg, ctx, temp_files),
+                    ctx.bot.send_chat_action(chat_id=msg.chat_id, action=ChatAction.TYPING),
+                    return_exceptions=True,
+                )
+                if isinstance(prompt, BaseException):
+                    raise prompt
+            else:
+                batch = await self._coalesce(user.id, msg)
+                if batch is None:
+                    return  # folded into an earlier update's prompt
+                prompt = "\n".join(m.text for m in batch if m.text)
+            if not prompt:
+                return
 
-        # Send typing indicator and placeholder message
-        await ctx.bot.send_chat_action(chat_id=msg.chat_id, action=ChatAction.TYPING)
-        reply = await msg.reply_text("⏳")
+            # Placeholder message
+            send = self._limiter.send
+            reply = await send(msg.chat_id, functools.partial(msg.reply_text, "⏳"))
 
-        # Stream callback — receives full text each time, replaces display
-        current_text = [""]  # mutable holder for latest full text
-        last_edit = 0.0
-        edit_lock = asyncio.Lock()
+            # One execution per project at a time — concurrent updates would
+            # otherwise type into the same pane and mix up extracted responses
+            async with self._project_lock(project):
+                # Stream callback — receives full text each time, replaces display.
+                # Only records the latest text; a single writer task does the edits.
+                editor = _StreamEditor(reply, self._limiter, self._edit_pacer)
 
-        async def stream_cb(full_text: str, is_final: bool) -> None:
-            nonlocal last_edit
-            if full_text:
-                current_text[0] = full_text
+                async def stream_cb(full_text: str, is_final: bool) -> None:
+                    if full_text:
+                        editor.update(full_text)
 
-            now = time.monotonic()
-            should_edit = is_final or (now - last_edit >= EDIT_THROTTLE)
-            if not should_edit or not current_text[0]:
-                return
+                editor.start()
 
-            async with edit_lock:
-                if not current_text[0].strip():
-                    return
-                display = _truncate(current_text[0])
+                # Execute
                 try:
-                    await reply.edit_text(display, link_preview_options=NO_PREVIEW)
-                    last_edit = time.monotonic()
-                except Exception:
-                    pass  # Telegram rate limit or message unchanged
-
-        # Execute
-        try:
-            result = await self.claude.execute_with_retry(
-                user_id=user.id,
-                project_dir=project,
-                prompt=prompt,
-                stream_cb=stream_cb,
-            )
-
-            # Build final display text
-            # Prefer streamed content (includes intermediate tool steps)
-            # Fall back to result.text (final extract_response)
-            streamed = current_text[0].strip()
-            result_text = result.text.strip() if result.text else ""
-            display_text = streamed if len(streamed) >= len(result_text) else result_text
-            if not display_text:
-                display_text = "⚙️ 도구 실행 완료 (텍스트 응답 없음)"
-
-            # Send final message (edit = silent)
-            if display_text:
-                if len(display_text) > TG_MAX_LEN - 100:
-                    try:
-                        await reply.delete()
-                    except Exception:
-                        pass
-                    parts = _split_message(display_text)
-                    for part in parts:
-                        await msg.reply_text(part, link_preview_options=NO_PREVIEW,
-                                             disable_notification=True)
-                else:
+                    result = await self.claude.execute_with_retry(
+                        user_id=user.id,
+                        project_dir=project,
+                        prompt=prompt,
+                        stream_cb=stream_cb,
+                    )
+
+                    # Build final display text
+                    # Prefer streamed content (includes intermediate tool steps)
+                    # Fall back to result.text (final extract_response)
+                    await editor.stop()
+                    streamed = editor.text.strip()
+                    result_text = result.text.strip() if result.text else ""
+                    display_text = streamed if len(streamed) >= len(result_text) else result_text
+                    if not display_text:
+                        display_text = "⚙️ 도구 실행 완료 (텍스트 응답 없음)"
+
+                    # Send final message (edit = silent)
+                    if display_text:
+                        await self._send_parts(msg, reply, _split_message(display_text), editor.sent)
+
+                    # Completion notification (new message = triggers sound)
+                    await send(msg.chat_id, functools.partial(msg.reply_text, "✅ 완료"))
+
+                except Exception as e:
+                    log.exception("Error processing message")
+                    await editor.stop()
                     try:
-                        await reply.edit_text(display_text, link_preview_options=NO_PREVIEW)
-                    except Exception:
-                        pass
+                        await send(msg.chat_id, functools.partial(
+                            reply.edit_text,
+                            f"❌ <b>오류</b>\n\n<code>{_escape(str(e)[:500])}</code>",
+                            parse_mode=ParseMode.HTML))
+                    except TelegramError:
+                        log.warning("Failed to show error message", exc_info=True)
+        finally:
+            # Claude is done with attached files — also on early exits and failed sends
+            if temp_files:
+                await asyncio.to_thread(_remove_files, temp_files)
+
+    async def _coalesce(self, user_id: int, msg: Message) -> list[Message] | None:
+        """Collect text updates from one user that arrive in quick succession.
+
+        The first update of a burst waits until no new part has arrived for
+        a window and returns the whole batch; later ones return None.
+        """
+        state = self._user(user_id)
+        batch = state.pending
+        batch.append(msg)
+        if len(batch) > 1:
+            return None
+        while True:
+            seen = len(batch)
+            long_part = len(batch[-1].text or "") >= SPLIT_PART_LEN
+            await asyncio.sleep(COALESCE_WINDOW_LONG if long_part else COALESCE_WINDOW)
+            if len(batch) == seen:
+                break
+        state.pending = []
+        return batch
+
+    async def _send_parts(
+        self, msg: Message, reply: Message, parts: list[str], shown: str = "",
+    ) -> None:
+        """Deliver the final response: part 1 replaces the placeholder, the rest follow.
 
-            # Completion notification (new message = triggers sound)
-            await msg.reply_text("✅ 완료")
+        Editing the placeholder saves the delete round-trip. Part 1 (or its
+        fallback message) is settled before the follow-ups go out, so the
+        parts arrive in order. `shown` is what the placeholder already
+        displays; if part 1 matches it the edit is skipped.
+        """
+        send = self._limiter.send
 
-        except Exception as e:
-            log.exception("Error processing message")
+        async def edit_first() -> bool:
+            if parts[0] == shown:
+                return True  # last stream edit already shows it — would only 400
             try:
-                await reply.edit_text(
-                    f"❌ <b>오류</b>\n\n<code>{_escape(str(e)[:500])}</code>",
-                    parse_mode=ParseMode.HTML)
-            except Exception:
-                pass
-
-    async def _build_prompt(self, msg, ctx: ContextTypes.DEFAULT_TYPE) -> str:
-        """Build prompt from message text and any attached files."""
+                await send(msg.chat_id, functools.partial(
+                    reply.edit_text, parts[0], link_preview_options=NO_PREVIEW))
+                return True
+            except BadRequest as e:
+                if _not_modified(e):
+                    return True  # already showing exactly this text
+                log.warning("Placeholder edit rejected: %s", e)
+                return False
+            except TelegramError:
+                log.warning("Failed to edit placeholder", exc_info=True)
+                return False
+
+        async def send_rest() -> None:
+            # A lost follow-up must not reach handle_message's error path,
+            # which would overwrite part 1 in the placeholder
+            for part in parts[1:]:
+                try:
+                    await send(msg.chat_id, functools.partial(
+                        msg.reply_text, part, link_preview_options=NO_PREVIEW,
+                        disable_notification=True))
+                except TelegramError:
+                    log.warning("Failed to send response part", exc_info=True)
+
+        if not await edit_first():
+            # Placeholder is gone — don't lose the first part
+            await send(msg.chat_id, functools.partial(
+                msg.reply_text, parts[0], link_preview_options=NO_PREVIEW,
+                disable_notification=True))
+        await send_rest()
+
+    async def _build_prompt(
+        self, msg, ctx: ContextTypes.DEFAULT_TYPE, temp_files: list[str],
+    ) -> str:
+        """Build prompt from message text and any attached files.
+
+        Files Claude must read later are appended to `temp_files`; the caller
+        removes them once the execution is done.
+        """
         parts: list[str] = []
 
         # Text
@@ -470,33 +875,71 @@ class Bot:
         elif msg.caption:
             parts.append(msg.caption)
 
-        # Document
-        if msg.document:
-            try:
-                file = await ctx.bot.get_file(msg.document.file_id)
-                suffix = Path(msg.document.file_name or "file").suffix
-                with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-                    await file.download_to_drive(tmp.name)
-                    content = Path(tmp.name).read_text(errors="replace")
-                    parts.append(f"\n--- File: {msg.document.file_name} ---\n{content}")
-                    os.unlink(tmp.name)
-            except Exception:
-                log.warning("Failed to download document", exc_info=True)
-
-        # Photo — mention that an image was sent (SDK handles vision if model supports it)
-        if msg.photo:
-            try:
-                photo = msg.photo[-1]  # highest resolution
-                file = await ctx.bot.get_file(photo.file_id)
-                with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-                    await file.download_to_drive(tmp.name)
-                    parts.append(f"\n[Image attached: {tmp.name}]")
-                    # Note: tmp not unlinked — Claude may need to read it
-            except Exception:
-                log.warning("Failed to download photo", exc_info=True)
+        # Attachments download concurrently; fragments keep document-then-photo order
+        fragments = await asyncio.gather(
+            self._fetch_document(msg, ctx, temp_files),
+            self._fetch_photo(msg, ctx, temp_files),
+        )
+        parts.extend(f for f in fragments if f)
 
         return "\n".join(parts)
 
+    async def _fetch_document(
+        self, msg, ctx: ContextTypes.DEFAULT_TYPE, temp_files: list[str],
+    ) -> str:
+        """Inline an attached document, or save a large one for Claude to read ("" if none/failed)."""
+        doc = msg.document
+        if not doc:
+            return ""
+        doc_size = doc.file_size or 0
+        if doc_size > MAX_DOC_DOWNLOAD_BYTES:
+            # Known from the update itself — Telegram won't serve it anyway
+            return (f"\n--- File: {doc.file_name} "
+                    f"(skipped: {doc_size} bytes, limit {MAX_DOC_DOWNLOAD_BYTES}) ---")
+        try:
+            file = await ctx.bot.get_file(doc.file_id)
+            if doc_size > MAX_DOC_BYTES:
+                # Too big to inline — stream to disk, Claude reads what it needs
+                suffix = os.path.splitext(doc.file_name or "")[1]
+                with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                    tmp_path = tmp.name
+                temp_files.append(tmp_path)
+                await file.download_to_drive(tmp_path)
+                return f"\n[File attached: {doc.file_name} ({doc_size} bytes): {tmp_path}]"
+            # Small enough to stay in memory — no temp file write/read/unlink
+            buf = io.BytesIO()
+            await file.download_to_memory(buf)
+            content = _decode_capped(buf.getvalue())
+            return f"\n--- File: {doc.file_name} ---\n{content}"
+        except Exception:
+            log.warning("Failed to download document", exc_info=True)
+            return ""
+
+    async def _fetch_photo(
+        self, msg, ctx: ContextTypes.DEFAULT_TYPE, temp_files: list[str],
+    ) -> str:
+        """Save an attached photo for Claude to read ("" if none/failed)."""
+        if not msg.photo:
+            return ""
+        # Mention that an image was sent (SDK handles vision if model supports it)
+        if not self.settings.vision_enabled:
+            return "\n[Image attached but vision disabled]"
+        try:
+            # Highest resolution that fits the cap (sizes are ascending)
+            photo = next(
+                (p for p in reversed(msg.photo) if (p.file_size or 0) <= MAX_PHOTO_BYTES),
+                msg.photo[0],
+            )
+            file = await ctx.bot.get_file(photo.file_id)
+            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
+                tmp_path = tmp.name
+            temp_files.append(tmp_path)
+            await file.download_to_drive(tmp_path)
+            return f"\n[Image attached: {tmp_path}]"
+        except Exception:
+            log.warning("Failed to download photo", exc_info=True)
+            return ""
+
     def build_application(self) -> Application:
         """Build and return the Telegram Application."""
         app = (
@@ -505,24 +948,25 @@ class Bot:
             .concurrent_updates(True)
             .build()
         )
-        # Commands
-        app.add_handler(CommandHandler("start", self.cmd_start))
-        app.add_handler(CommandHandler("help", self.cmd_help))
-        app.add_handler(CommandHandler("stop", self.cmd_stop))
-        app.add_handler(CommandHandler("esc", self.cmd_esc))
-        app.add_handler(CommandHandler("yes", self.cmd_yes))
-        app.add_handler(CommandHandler("new", self.cmd_new))
-        app.add_handler(CommandHandler("project", self.cmd_project))
-        app.add_handler(CommandHandler("projects", self.cmd_projects))
-        app.add_handler(CommandHandler("status", self.cmd_status))
-        # Number shortcuts: /1, /2, ... /20 for quick project switch
-        for n in range(1, 21):
-            app.add_handler(CommandHandler(str(n), self.cmd_switch_by_number))
-        # Messages (text, documents, photos)
-        app.add_handler(
-            MessageHandler(
-                filters.TEXT & ~filters.COMMAND | filters.Document.ALL | filters.PHOTO,
-                self.handle_message,
-            )
+        # Non-allowed users are dropped here; handlers re-check via _allowed_only
+        users = self._user_filter
+        commands = (
+            ("start", self.cmd_start),
+            ("help", self.cmd_help),
+            ("stop", self.cmd_stop),
+            ("esc", self.cmd_esc),
+            ("yes", self.cmd_yes),
+            ("new", self.cmd_new),
+            ("project", self.cmd_project),
+            ("projects", self.cmd_projects),
+            ("status", self.cmd_status),
         )
+        app.add_handlers([
+            *(CommandHandler(name, fn, filters=users) for name, fn in commands),
+            # Number shortcuts: /1, /2, ... /20 for quick project switch
+            CommandHandler([str(n) for n in range(1, 21)], self.cmd_switch_by_number,
+                           filters=users),
+            # Messages (text, documents, photos)
+            MessageHandler(MESSAGE_FILTER & users, self.handle_message),
+        ])
         return app
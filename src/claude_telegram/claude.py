@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import asyncio
+import io
 import json
 import logging
 import os
@@ -156,11 +157,24 @@ def is_claude_idle(pane_content: str) -> bool:
     return has_prompt
 
 
+async def tmux_send_keys(pane_id: str, *keys: str) -> None:
+    """Run `tmux send-keys` without blocking the event loop."""
+    proc = await asyncio.create_subprocess_exec(
+        "tmux", "send-keys", "-t", pane_id, *keys,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=5)
+    except asyncio.TimeoutError:
+        proc.kill()
+        raise
+
+
 async def send_to_tmux(pane_id: str, message: str) -> None:
     single_line = message.replace("\n", " ").strip()
-    subprocess.run(["tmux", "send-keys", "-t", pane_id, "-l", single_line], timeout=5)
+    await tmux_send_keys(pane_id, "-l", single_line)
     await asyncio.sleep(0.1)
-    subprocess.run(["tmux", "send-keys", "-t", pane_id, "Enter"], timeout=5)
+    await tmux_send_keys(pane_id, "Enter")
 
 
 def extract_response(before: str, after: str, user_msg: str) -> str:
@@ -331,10 +345,7 @@ class TmuxSession:
     async def interrupt(self) -> bool:
         if self._running:
             self._interrupted = True
-            subprocess.run(
-                ["tmux", "send-keys", "-t", self.info.pane_id, "C-c"],
-                timeout=5,
-            )
+            await tmux_send_keys(self.info.pane_id, "C-c")
             log.info("Sent Ctrl+C to %s", self.info.project)
             self._running = False
             return True
@@ -818,7 +829,8 @@ class SDKSession:
 
         self._running = True
         result = SessionResult(session_name=self.info.project)
-        text_parts: list[str] = []
+        # Append-only buffer — no re-join of every block per stream update
+        text_buf = io.StringIO()
 
         try:
             opts = ClaudeAgentOptions(
@@ -851,20 +863,20 @@ class SDKSession:
                 elif isinstance(msg, AssistantMessage):
                     for block in msg.content:
                         if isinstance(block, TextBlock) and block.text:
-                            text_parts.append(block.text)
+                            text_buf.write(block.text)
                             if stream_cb:
                                 # Send full accumulated text (consistent with tmux mode)
-                                await stream_cb("".join(text_parts), False)
+                                await stream_cb(text_buf.getvalue(), False)
 
                 elif isinstance(msg, ResultMessage):
                     if msg.session_id:
                         self._sdk_session_id = msg.session_id
-                    if not text_parts and msg.result:
-                        text_parts.append(msg.result)
+                    if not text_buf.tell() and msg.result:
+                        text_buf.write(msg.result)
                         if stream_cb:
-                            await stream_cb("".join(text_parts), False)
+                            await stream_cb(text_buf.getvalue(), False)
 
-            result.text = "".join(text_parts)
+            result.text = text_buf.getvalue()
             if stream_cb:
                 await stream_cb("", True)
 
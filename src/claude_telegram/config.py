@@ -21,6 +21,7 @@ class Settings(BaseSettings):
     allowed_tools: str = ""  # comma-separated tool names
     model: str = ""
     max_turns: int = 0
+    vision_enabled: bool = True  # download photos for Claude to read
 
     # Storage
     db_path: str = ""
@@ -28,6 +28,16 @@ def _setup_logging(level: str) -> None:
     logging.getLogger("telegram").setLevel(logging.WARNING)
 
 
+def _install_uvloop() -> None:
+    """Use uvloop when installed (`fast` extra) — cheaper awaits for I/O glue."""
+    try:
+        import uvloop  # type: ignore[import-not-found]
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    log.info("Event loop: uvloop")
+
+
 async def _init_store(settings: Settings) -> Store:
     store = Store(settings.get_db_path())
     await store.init()
@@ -50,6 +60,8 @@ def main() -> None:
     log.info("Allowed users: %s", settings.get_allowed_users() or "all")
     log.info("Permission mode: %s", settings.permission_mode)
 
+    _install_uvloop()
+
     # Initialize store (need a quick event loop for async init)
     store = asyncio.run(_init_store(settings))
     log.info("Database: %s", settings.get_db_path())
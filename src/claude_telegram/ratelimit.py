@@ -0,0 +1,105 @@
+"""Outgoing Telegram rate limiting — global + per-chat token buckets."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Awaitable, Callable, TypeVar
+
+from telegram.error import RetryAfter
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Bot API limits: ~30 messages/s per bot, ~1 message/s per chat
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+# Per-chat buckets kept (LRU) — same bound as Bot.MAX_TRACKED_USERS
+MAX_TRACKED_CHATS = 10_000
+
+
+def retry_after_seconds(e: RetryAfter) -> float:
+    """RetryAfter.retry_after is int or timedelta depending on PTB settings."""
+    ra = e.retry_after
+    return ra.total_seconds() if isinstance(ra, timedelta) else float(ra)
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._stamp = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take one token, returning how long to wait before using it.
+
+        Tokens may go negative — callers queue up in reservation order
+        without needing a lock (single event loop thread).
+        """
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+
+class RateLimiter:
+    """Paces every send/edit and halts all senders on flood control (429)."""
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: int = CHAT_BURST,
+    ) -> None:
+        self._global = _TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: OrderedDict[int, _TokenBucket] = OrderedDict()
+        self._pause_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every sender for `seconds` (server-provided retry_after)."""
+        self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+
+    async def _acquire(self, chat_id: int) -> None:
+        chats = self._chats
+        bucket = chats.get(chat_id)
+        if bucket is None:
+            bucket = chats[chat_id] = _TokenBucket(self._chat_rate, self._chat_burst)
+            if len(chats) > MAX_TRACKED_CHATS:
+                # Least recently used chat has long since refilled
+                chats.popitem(last=False)
+        else:
+            chats.move_to_end(chat_id)
+        wait = max(
+            bucket.reserve(),
+            self._global.reserve(),
+            self._pause_until - time.monotonic(),
+        )
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def send(self, chat_id: int, call: Callable[[], Awaitable[T]]) -> T:
+        """Run `call()` once both buckets allow it.
+
+        On RetryAfter all senders pause for the requested interval and the
+        call is retried once; a second RetryAfter propagates.
+        """
+        await self._acquire(chat_id)
+        try:
+            return await call()
+        except RetryAfter as e:
+            delay = retry_after_seconds(e)
+            log.warning("Telegram flood control — pausing sends for %.1fs", delay)
+            self.pause(delay)
+        await self._acquire(chat_id)
+        return await call()
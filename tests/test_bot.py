@@ -0,0 +1,370 @@
+"""Pure helper tests for bot.py (no Telegram connection needed)."""
+import asyncio
+import random
+from types import SimpleNamespace
+
+from claude_telegram import bot as bot_mod
+from claude_telegram.bot import (
+    Bot,
+    _basename,
+    _basename_lower,
+    _decode_capped,
+    _escape,
+    _remove_files,
+    _split_message,
+    _truncate_tail,
+)
+
+
+def _split_reference(text: str, limit: int) -> list[str]:
+    """Original slice-and-lstrip splitter, kept as a behavioural oracle."""
+    if len(text) <= limit:
+        return [text]
+    parts: list[str] = []
+    while text:
+        if len(text) <= limit:
+            parts.append(text)
+            break
+        split_at = text.rfind("\n", 0, limit)
+        if split_at < limit // 2:
+            split_at = limit
+        parts.append(text[:split_at])
+        text = text[split_at:].lstrip("\n")
+    return parts
+
+
+def test_split_short_text():
+    assert _split_message("hello", limit=10) == ["hello"]
+
+
+def test_split_prefers_newline():
+    text = "a" * 8 + "\n" + "b" * 8
+    assert _split_message(text, limit=10) == ["a" * 8, "b" * 8]
+
+
+def test_split_hard_cut_without_newline():
+    assert _split_message("x" * 25, limit=10) == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_split_skips_newline_runs():
+    text = "a" * 8 + "\n\n\n" + "b" * 8
+    assert _split_message(text, limit=9) == ["a" * 8, "b" * 8]
+
+
+def test_split_matches_reference():
+    """Index walk produces exactly the same parts as the original splitter."""
+    rng = random.Random(1234)
+    alphabet = "ab가나 \n"
+    for _ in range(300):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 400)))
+        limit = rng.randint(4, 60)
+        assert _split_message(text, limit) == _split_reference(text, limit)
+
+
+def test_decode_capped_small_file():
+    assert _decode_capped("안녕 hello".encode()) == "안녕 hello"
+
+
+def test_decode_capped_truncates():
+    assert _decode_capped(b"x" * 100, limit=10) == "x" * 10 + "\n... (truncated at 10 bytes)"
+
+
+def test_truncate_tail_keeps_latest_output():
+    assert _truncate_tail("short", limit=10) == "short"
+    out = _truncate_tail("a" * 20 + "\nbbbb\ncccc", limit=10)
+    assert out == bot_mod.TRUNC_PREFIX + "bbbb\ncccc"
+    assert _truncate_tail("x" * 30, limit=10) == bot_mod.TRUNC_PREFIX + "x" * 10
+
+
+def test_remove_files_ignores_missing(tmp_path):
+    p = tmp_path / "a.jpg"
+    p.write_bytes(b"x")
+    _remove_files([str(p), str(tmp_path / "gone.jpg")])
+    assert not p.exists()
+
+
+def test_escape_element_text():
+    assert _escape('<b>a & "b"</b>') == '&lt;b&gt;a &amp; "b"&lt;/b&gt;'
+
+
+def test_basename_lower_ignores_trailing_slash():
+    assert _basename_lower("/home/me/My-App/") == "my-app"
+    assert _basename_lower("") == ""
+
+
+def test_basename_keeps_case():
+    assert _basename("/home/me/My-App/") == "My-App"
+    assert _basename("My-App") == "My-App"
+
+
+def _bot() -> Bot:
+    settings = SimpleNamespace(get_allowed_users=lambda: [], get_project_dirs=lambda: [])
+    return Bot(settings, None, None)  # type: ignore[arg-type]
+
+
+def test_user_state_evicts_least_recent_idle(monkeypatch):
+    monkeypatch.setattr(bot_mod, "MAX_TRACKED_USERS", 2)
+
+    async def run():
+        b = _bot()
+        b._user(1).pending.append(SimpleNamespace(text="a"))  # mid-burst — must survive eviction
+        b._user(2)
+        b._user(3)
+        assert list(b._users) == [1, 3]
+        b._user(1)
+        b._user(4)
+        assert list(b._users) == [1, 4]
+
+    asyncio.run(run())
+
+
+def test_coalesce_merges_burst(monkeypatch):
+    monkeypatch.setattr(bot_mod, "COALESCE_WINDOW", 0.05)
+
+    async def run():
+        b = _bot()
+        msgs = [SimpleNamespace(text=t) for t in ("a", "b", "c")]
+
+        async def later(m, delay):
+            await asyncio.sleep(delay)
+            return await b._coalesce(1, m)
+
+        results = await asyncio.gather(*(later(m, i * 0.02) for i, m in enumerate(msgs)))
+        assert results[0] == msgs
+        assert results[1:] == [None, None]
+        # The next message after the window starts a new batch
+        assert await b._coalesce(1, SimpleNamespace(text="d")) is not None
+
+    asyncio.run(run())
+
+
+def test_send_parts_skips_unchanged_first_edit():
+    async def run():
+        b = _bot()
+        calls: list[str] = []
+
+        async def edit_text(text, **kw):
+            calls.append(text)
+
+        reply = SimpleNamespace(edit_text=edit_text)
+        msg = SimpleNamespace(chat_id=1)
+        await b._send_parts(msg, reply, ["done"], shown="done")
+        assert calls == []
+        await b._send_parts(msg, reply, ["done"], shown="partial")
+        assert calls == ["done"]
+
+    asyncio.run(run())
+
+
+def test_project_list_shares_session_snapshot():
+    refreshes: list[int] = []
+    sessions = {
+        "app": SimpleNamespace(work_dir="/w/app", project="app"),
+        "sdk:x": SimpleNamespace(work_dir="/w/x", project="x"),
+    }
+    claude = SimpleNamespace(
+        refresh=lambda: refreshes.append(1), get_all_sessions=lambda: sessions)
+    settings = SimpleNamespace(
+        get_allowed_users=lambda: [], get_project_dirs=lambda: ["/w/app", "/w/Lib"])
+    b = Bot(settings, claude, None)  # type: ignore[arg-type]
+    expected = ((1, "app", "/w/app", True), (2, "Lib", "/w/Lib", False))
+    assert b._build_project_list() == expected
+    assert b._build_project_list() == expected
+    assert len(refreshes) == 1
+
+
+def test_large_document_saved_for_claude(monkeypatch):
+    monkeypatch.setattr(bot_mod, "MAX_DOC_BYTES", 4)
+
+    class File:
+        async def download_to_drive(self, path):
+            with open(path, "wb") as f:
+                f.write(b"0123456789")
+
+    async def get_file(file_id):
+        return File()
+
+    async def run():
+        b = _bot()
+        msg = SimpleNamespace(document=SimpleNamespace(file_size=10, file_name="big.log", file_id="d"))
+        ctx = SimpleNamespace(bot=SimpleNamespace(get_file=get_file))
+        temp_files: list[str] = []
+        fragment = await b._fetch_document(msg, ctx, temp_files)
+        assert len(temp_files) == 1 and temp_files[0].endswith(".log")
+        assert temp_files[0] in fragment
+        with open(temp_files[0], "rb") as f:
+            assert f.read() == b"0123456789"
+        _remove_files(temp_files)
+
+    asyncio.run(run())
+
+
+def test_send_parts_survives_failed_follow_up():
+    from telegram.error import NetworkError
+
+    async def run():
+        b = _bot()
+        edits: list[str] = []
+        sent: list[str] = []
+
+        async def edit_text(text, **kw):
+            edits.append(text)
+
+        async def reply_text(text, **kw):
+            if text == "two":
+                raise NetworkError("boom")
+            sent.append(text)
+
+        reply = SimpleNamespace(edit_text=edit_text)
+        msg = SimpleNamespace(chat_id=1, reply_text=reply_text)
+        await b._send_parts(msg, reply, ["one", "two", "three"])
+        assert edits == ["one"]
+        assert sent == ["three"]
+
+    asyncio.run(run())
+
+
+def test_stream_editor_survives_other_telegram_errors(monkeypatch):
+    from telegram.error import Forbidden
+
+    monkeypatch.setattr(bot_mod, "EDIT_THROTTLE", 0.01)
+
+    async def run():
+        edits: list[str] = []
+
+        async def edit_text(text, **kw):
+            edits.append(text)
+            if len(edits) == 1:
+                raise Forbidden("bot was blocked by the user")
+
+        reply = SimpleNamespace(chat_id=1, edit_text=edit_text)
+        editor = bot_mod._StreamEditor(reply, bot_mod.RateLimiter(), bot_mod._EditPacer())
+        editor.start()
+        editor.update("first")
+        await asyncio.sleep(0.05)
+        editor.update("second" + "x" * bot_mod.EDIT_MIN_DELTA)
+        await asyncio.sleep(0.05)
+        await editor.stop()
+        assert edits == ["first", "second" + "x" * bot_mod.EDIT_MIN_DELTA]
+
+    asyncio.run(run())
+
+
+def test_default_project_follows_current_sessions(monkeypatch):
+    monkeypatch.setattr(bot_mod, "SESSION_CACHE_TTL", 0.0)
+    sessions: dict = {}
+
+    def refresh():
+        raise AssertionError("message path must not reload the registry")
+
+    claude = SimpleNamespace(refresh=refresh, get_all_sessions=lambda: dict(sessions))
+    settings = SimpleNamespace(get_allowed_users=lambda: [], get_project_dirs=lambda: [])
+    b = Bot(settings, claude, None)  # type: ignore[arg-type]
+    assert b._get_project(1) is None
+    sessions["app"] = SimpleNamespace(work_dir="/w/app", project="app")
+    assert b._get_project(1) == "/w/app"
+    assert b._get_project_base(1) == "app"
+
+
+def test_failed_photo_download_leaves_no_temp_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot_mod.tempfile, "tempdir", str(tmp_path))
+
+    class File:
+        async def download_to_drive(self, path):
+            raise OSError("network down")
+
+    async def get_file(file_id):
+        return File()
+
+    async def send_chat_action(**kw):
+        pass
+
+    async def run():
+        b = _bot()
+        b.settings.vision_enabled = True
+        b._default_project = "/w/app"
+        b._sessions = lambda: {}
+        msg = SimpleNamespace(
+            chat_id=1, text=None, caption=None, document=None,
+            photo=[SimpleNamespace(file_size=3, file_id="p")])
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=1), message=msg)
+        ctx = SimpleNamespace(bot=SimpleNamespace(get_file=get_file, send_chat_action=send_chat_action))
+        await b.handle_message(update, ctx)
+
+    asyncio.run(run())
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_only_listing_reloads_the_registry(monkeypatch):
+    monkeypatch.setattr(bot_mod, "SESSION_CACHE_TTL", 0.0)
+    refreshes: list[int] = []
+    sessions = {"app": SimpleNamespace(work_dir="/w/app", project="app")}
+    claude = SimpleNamespace(
+        refresh=lambda: refreshes.append(1), get_all_sessions=lambda: dict(sessions))
+    settings = SimpleNamespace(get_allowed_users=lambda: [], get_project_dirs=lambda: [])
+    b = Bot(settings, claude, None)  # type: ignore[arg-type]
+    for _ in range(3):
+        assert b._get_project(1) == "/w/app"
+        assert b._get_project_base(1) == "app"
+    assert refreshes == []
+    b._build_project_list()
+    assert refreshes == [1]
+
+
+
+def test_users_on_one_project_run_one_at_a_time(monkeypatch):
+    monkeypatch.setattr(bot_mod, "COALESCE_WINDOW", 0.01)
+    running: list[int] = []
+    overlaps: list[int] = []
+
+    async def execute_with_retry(user_id, project_dir, prompt, stream_cb):
+        if running:
+            overlaps.append(user_id)
+        running.append(user_id)
+        await asyncio.sleep(0.05)
+        running.remove(user_id)
+        return SimpleNamespace(text="ok")
+
+    async def edit_text(text, **kw):
+        pass
+
+    async def reply_text(text, **kw):
+        return SimpleNamespace(chat_id=1, edit_text=edit_text)
+
+    sessions = {"app": SimpleNamespace(work_dir="/w/app", project="app")}
+    claude = SimpleNamespace(get_all_sessions=lambda: sessions, execute_with_retry=execute_with_retry)
+    settings = SimpleNamespace(get_allowed_users=lambda: [], get_project_dirs=lambda: [])
+    b = Bot(settings, claude, None)  # type: ignore[arg-type]
+
+    def update(uid):
+        msg = SimpleNamespace(chat_id=uid, text="hi", caption=None, document=None, photo=None,
+                              reply_text=reply_text)
+        return SimpleNamespace(effective_user=SimpleNamespace(id=uid), message=msg)
+
+    async def run():
+        await asyncio.gather(*(b.handle_message(update(uid), None) for uid in (1, 2)))
+
+    asyncio.run(run())
+    assert overlaps == []
+
+
+def test_send_parts_fallback_keeps_order():
+    from telegram.error import BadRequest
+
+    async def run():
+        b = _bot()
+        sent: list[str] = []
+
+        async def edit_text(text, **kw):
+            await asyncio.sleep(0.01)
+            raise BadRequest("Message to edit not found")
+
+        async def reply_text(text, **kw):
+            sent.append(text)
+
+        reply = SimpleNamespace(edit_text=edit_text)
+        msg = SimpleNamespace(chat_id=1, reply_text=reply_text)
+        await b._send_parts(msg, reply, ["one", "two", "three"])
+        assert sent == ["one", "two", "three"]
+
+    asyncio.run(run())
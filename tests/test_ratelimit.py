@@ -0,0 +1,71 @@
+"""RateLimiter pacing and flood-control tests (no Telegram connection needed)."""
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from claude_telegram import ratelimit
+from claude_telegram.ratelimit import RateLimiter
+
+
+def test_chat_bucket_paces_after_burst():
+    """Sends beyond the per-chat burst are spaced by 1/chat_rate."""
+    limiter = RateLimiter(global_rate=1000, chat_rate=20, chat_burst=2)
+    stamps: list[float] = []
+
+    async def call() -> None:
+        stamps.append(time.monotonic())
+
+    async def run() -> None:
+        for _ in range(4):
+            await limiter.send(1, call)
+
+    asyncio.run(run())
+    # First two go out immediately, the next two wait ~50ms each
+    assert stamps[1] - stamps[0] < 0.03
+    assert stamps[3] - stamps[1] >= 0.09
+
+
+def test_chats_do_not_share_bucket():
+    limiter = RateLimiter(global_rate=1000, chat_rate=1, chat_burst=1)
+
+    async def call() -> str:
+        return "ok"
+
+    async def run() -> float:
+        start = time.monotonic()
+        for chat_id in range(5):
+            assert await limiter.send(chat_id, call) == "ok"
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.1
+
+
+def test_retry_after_pauses_and_retries_once():
+    limiter = RateLimiter(global_rate=1000, chat_rate=1000, chat_burst=10)
+    attempts: list[float] = []
+
+    async def call() -> str:
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RetryAfter(0.1)
+        return "sent"
+
+    assert asyncio.run(limiter.send(1, call)) == "sent"
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.09
+
+
+def test_chat_buckets_are_bounded(monkeypatch):
+    monkeypatch.setattr(ratelimit, "MAX_TRACKED_CHATS", 2)
+    limiter = RateLimiter(global_rate=1000, chat_rate=1000, chat_burst=10)
+
+    async def call() -> None:
+        pass
+
+    async def run() -> None:
+        for chat_id in (1, 2, 1, 3):
+            await limiter.send(chat_id, call)
+
+    asyncio.run(run())
+    assert list(limiter._chats) == [1, 3]